@@ -13,11 +13,14 @@ from __future__ import annotations
 
 import csv
 import math
+import queue
+import threading
 from dataclasses import dataclass
 from pathlib import Path
 import time
-from typing import List, Sequence, Tuple
+from typing import Dict, List, Sequence, Tuple
 
+import numpy as np
 from labjack import ljm
 from labjack.ljm import errorcodes
 
@@ -31,6 +34,9 @@ LED_AMPLITUDE_V = 2.0
 LED_OFFSET_V = 2.5
 LED_IDLE_V = 0.0
 DATA_LOG_PATH = Path("labjack_stream.csv")  # Default location for streamed data
+LOG_FILE_BUFFER_BYTES = 1 << 20         # Large write buffer so chunks hit disk in few syscalls
+LOG_QUEUE_MAX_CHUNKS = 16               # Chunks buffered between acquisition and the CSV writer thread
+LOG_QUEUE_CLOSE_TIMEOUT_S = 5.0         # How long shutdown waits to hand the writer thread its stop sentinel
 
 # Channel mapping assumptions (T7 / T8)
 PHOTODETECTOR_AIN = "AIN0"
@@ -39,10 +45,14 @@ LED_MONITOR_AIN = "AIN2"                # Optional feedback of the LED drive wav
 LED_DAC_CHANNEL = "DAC0"
 STREAM_OUT_INDEX = 0                    # Use STREAM_OUT0 to drive DAC0
 TTL_STREAM_OUT_INDEX = 1                # STREAM_OUT1 drives the TTL trigger
+STREAM_OUT_BYTES_PER_SAMPLE = 2         # Stream-out buffers store 16-bit values
+STREAM_OUT_MIN_BUFFER_BYTES = 64        # Smallest buffer we allocate (BUFFER_SIZE must be a power of 2)
+STREAM_OUT_MAX_BUFFER_BYTES = 16384     # Device limit for STREAM_OUT#_BUFFER_SIZE
 START_PULSE_CHANNEL = "FIO0"            # Digital line that fires the camera
 START_PULSE_TARGET = "FIO_STATE"        # Port register for stream-out targeting FIO pins
 FIO0_MASK_ALLOW = 0xFE                  # Mask that allows only FIO0 to change
 START_PULSE_WIDTH_S = 0.001             # Pulse duration (seconds)
+MAX_BLOCKING_WAIT_US = 100000           # Upper limit accepted by WAIT_US_BLOCKING
 CAMERA_TRIGGER_RATE_HZ = 30.0           # Default pulse train frequency (Hz)
 NUM_CAMERA_FRAMES = 300                 # Default number of TTL pulses/frames
 
@@ -69,6 +79,10 @@ class StreamedLabJackController:
         - hardware-timed waveform generation on DAC0 via STREAM_OUT0
     """
 
+    # One period of the LED sine wave, keyed by (samples_per_period, amplitude, offset).
+    # Shared across instances so repeated start_stream calls skip regeneration.
+    _led_waveform_cache: Dict[Tuple[int, float, float], np.ndarray] = {}
+
     def __init__(
         self,
         device_type: str = "ANY",
@@ -85,44 +99,91 @@ class StreamedLabJackController:
         )
         self._scan_list_addresses: List[int] = []  # Populated later based on enabled I/O
         self._actual_scan_rate = self.stream_config.scan_rate_hz  # Updated after eStreamStart
-        self._ttl_waveform: List[int] | None = None  # Holds the DIO stream-out pattern
+        self._ttl_waveform: np.ndarray | None = None  # Holds the DIO stream-out pattern (uint16)
         self._ttl_duration_s: float = 0.0  # Duration of the TTL train in seconds
         self._ttl_num_pulses: int = 0  # Number of TTL pulses requested
+        # name -> (address, data type) for every register written repeatedly, resolved once.
+        self._registers: Dict[str, Tuple[int, int]] = {}
+        self._resolve_registers()
         self._configure_channels()
         self._num_inputs = len(self.stream_config.input_names)
+        self._chunk_buffer: np.ndarray | None = None  # (scans_per_read, inputs) layout, built in start_stream
 
     # ------------------------------------------------------------------ setup
+    def _resolve_registers(self):
+        """Pre-resolve recurring register names so hot writes can go straight to eWriteAddress."""
+        names = [LED_DAC_CHANNEL, "FIO_DIRECTION", "FIO_STATE", START_PULSE_TARGET, "WAIT_US_BLOCKING"]
+        for index in (STREAM_OUT_INDEX, TTL_STREAM_OUT_INDEX):
+            base = f"STREAM_OUT{index}"
+            names.extend(
+                f"{base}_{suffix}"
+                for suffix in ("ENABLE", "TARGET", "BUFFER_SIZE", "LOOP_SIZE", "SET_LOOP", "BUFFER_F32", "BUFFER_U16")
+            )
+        for name in names:
+            self._register(name)
+
+    def _register(self, name: str) -> Tuple[int, int]:
+        """Return the cached (address, data type) for a register name, resolving it on first use."""
+        info = self._registers.get(name)
+        if info is None:
+            address, data_type = ljm.nameToAddress(name)
+            info = self._registers[name] = (address, data_type)
+        return info
+
+    def _write_register(self, name: str, value: float):
+        address, data_type = self._register(name)
+        ljm.eWriteAddress(self.handle, address, data_type, value)
+
+    def _write_registers(self, names: Sequence[str], values: Sequence[float]):
+        """Write several registers in order, packed into a single Modbus packet."""
+        addresses, data_types = zip(*(self._register(name) for name in names))
+        ljm.eWriteAddresses(self.handle, len(names), list(addresses), list(data_types), list(values))
+
     def _configure_channels(self):
         """Apply analog range / settling settings once before streaming."""
+        # Every setting goes out in a single eWriteNames call, which LJM packs into one packet.
+        names: List[str] = []
+        values: List[float] = []
+        optional: List[Tuple[str, float]] = []  # registers some devices/firmware don't expose
         if self.device_type == ljm.constants.dtT4:
             # T4: only a few AIN support ranges; keep defaults.
-            ljm.eWriteNames(
-                self.handle,
-                2,
-                ["STREAM_SETTLING_US", "STREAM_RESOLUTION_INDEX"],
-                [0, 0],
-            )
+            names.extend(["STREAM_SETTLING_US", "STREAM_RESOLUTION_INDEX"])
+            values.extend([0, 0])
         else:
             # T7/T8: disable trigger, use internal clock, set +/-10 V range, single-ended.
             try:
                 ljm.eStreamStop(self.handle)  # ensure no prior stream is active
             except ljm.LJMError:
                 pass
-            ljm.eWriteName(self.handle, "STREAM_TRIGGER_INDEX", 0)  # ensure stream is free-running
-            ljm.eWriteName(self.handle, "STREAM_CLOCK_SOURCE", 0)  # use the internal clock
-            self._write_optional_register("DIO_ANALOG_ENABLE", 0)  # force all DIO to digital mode
-            a_names = ["STREAM_RESOLUTION_INDEX", "STREAM_SETTLING_US"]  # global stream settings
-            a_values = [0, 0]
+            names.extend(["STREAM_TRIGGER_INDEX", "STREAM_CLOCK_SOURCE"])  # free-running, internal clock
+            values.extend([0, 0])
+            names.extend(["STREAM_RESOLUTION_INDEX", "STREAM_SETTLING_US"])  # global stream settings
+            values.extend([0, 0])
             for ain in self.stream_config.input_names:
-                a_names.extend([f"{ain}_RANGE", f"{ain}_NEGATIVE_CH"])  # per-channel config
-                a_values.extend([10.0, 199])  # +/-10 V single-ended for each AIN
-            ljm.eWriteNames(self.handle, len(a_names), a_names, a_values)  # batch write the config
+                names.extend([f"{ain}_RANGE", f"{ain}_NEGATIVE_CH"])  # per-channel config
+                values.extend([10.0, 199])  # +/-10 V single-ended for each AIN
 
-        self._configure_fio0_direction()
         # Ensure DAC sits at a safe idle level before the stream starts.
-        ljm.eWriteName(self.handle, LED_DAC_CHANNEL, LED_IDLE_V)
-        # Default the camera start line low.
-        self._set_fio0_state(False)
+        names.append(LED_DAC_CHANNEL)
+        values.append(LED_IDLE_V)
+        # Make only FIO0 a digital output (inhibit mask in upper byte), then default it low.
+        optional.append(("FIO_DIRECTION", (FIO0_MASK_ALLOW << 8) | 0x01))
+        optional.append(("FIO_STATE", FIO0_MASK_ALLOW << 8))
+
+        try:
+            ljm.eWriteNames(
+                self.handle,
+                len(names) + len(optional),
+                names + [name for name, _ in optional],
+                values + [value for _, value in optional],
+            )
+        except ljm.LJMError as exc:
+            if getattr(exc, "errorCode", None) != errorcodes.MBE2_ILLEGAL_DATA_ADDRESS:
+                raise
+            # An optional register is missing: resend the required ones, then write the rest one by one.
+            ljm.eWriteNames(self.handle, len(names), names, values)
+            for name, value in optional:
+                self._write_optional_register(name, value)
         self._scan_list_addresses = []
 
     # ------------------------------------------------------------------ LED waveform
@@ -135,10 +196,13 @@ class StreamedLabJackController:
         if samples_per_period < 2:
             raise ValueError("Scan rate must be at least 2x the LED frequency.")
 
-        waveform = [
-            LED_OFFSET_V + LED_AMPLITUDE_V * math.sin((2 * math.pi * i) / samples_per_period)
-            for i in range(samples_per_period)
-        ]
+        key = (samples_per_period, LED_AMPLITUDE_V, LED_OFFSET_V)
+        waveform = self._led_waveform_cache.get(key)
+        if waveform is None:
+            # Evaluate the whole period in one vectorized pass instead of per-sample math.sin.
+            phase = np.arange(samples_per_period, dtype=np.float32) * (2 * np.pi / samples_per_period)
+            waveform = (LED_OFFSET_V + LED_AMPLITUDE_V * np.sin(phase)).astype(np.float32)
+            self._led_waveform_cache[key] = waveform
 
         self._configure_stream_out(STREAM_OUT_INDEX, LED_DAC_CHANNEL, waveform, loop=True)
         print(f"STREAM_OUT{STREAM_OUT_INDEX} buffer ready ({len(waveform)} samples).")
@@ -157,9 +221,9 @@ class StreamedLabJackController:
 
         high_word = (FIO0_MASK_ALLOW << 8) | 0x01
         low_word = (FIO0_MASK_ALLOW << 8)
-        waveform: List[int] = []
-        waveform.extend([high_word] * high_samples)
-        waveform.extend([low_word] * (samples_per_period - high_samples))
+        waveform = np.empty(samples_per_period, dtype=np.uint16)
+        waveform[:high_samples] = high_word
+        waveform[high_samples:] = low_word
 
         self._ttl_num_pulses = num_pulses
         self._ttl_waveform = waveform
@@ -167,7 +231,7 @@ class StreamedLabJackController:
 
     def configure_ttl_stream_out(self):
         """Load the TTL waveform into STREAM_OUT1 targeting the camera trigger line."""
-        if not self._ttl_waveform:
+        if self._ttl_waveform is None:
             return
         self._configure_stream_out(
             TTL_STREAM_OUT_INDEX,
@@ -185,47 +249,63 @@ class StreamedLabJackController:
         self,
         index: int,
         target_name: str,
-        waveform: List[float] | List[int],
+        waveform: np.ndarray | Sequence[float],
         loop: bool,
         value_type: str = "f32",
     ):
         base = f"STREAM_OUT{index}"
-        target_addr = ljm.nameToAddress(target_name)[0]
-        ljm.eWriteName(self.handle, f"{base}_ENABLE", 0)
-        buffer_size = max(512, 2 ** int(math.ceil(math.log2(max(1, len(waveform))))))
-        buffer_size = min(buffer_size, 8192)
-        ljm.eWriteName(self.handle, f"{base}_TARGET", target_addr)
-        ljm.eWriteName(self.handle, f"{base}_BUFFER_SIZE", buffer_size)
-        ljm.eWriteName(self.handle, f"{base}_ENABLE", 1)
-        ljm.eWriteName(self.handle, f"{base}_LOOP_SIZE", len(waveform))
-
-        buffer_reg = f"{base}_BUFFER_F32" if value_type == "f32" else f"{base}_BUFFER_U16"
-        for value in waveform:
-            for attempt in range(3):
-                try:
-                    ljm.eWriteName(self.handle, buffer_reg, value)
-                    break
-                except ljm.LJMError:
-                    if attempt == 2:
-                        raise
-                    time.sleep(0.01)
+        target_addr = self._register(target_name)[0]
+        # Smallest power-of-two byte count that holds the waveform, instead of a fixed 512+ floor.
+        needed_bytes = max(STREAM_OUT_MIN_BUFFER_BYTES, len(waveform) * STREAM_OUT_BYTES_PER_SAMPLE)
+        buffer_size = 2 ** int(math.ceil(math.log2(needed_bytes)))
+        if buffer_size > STREAM_OUT_MAX_BUFFER_BYTES:
+            max_samples = STREAM_OUT_MAX_BUFFER_BYTES // STREAM_OUT_BYTES_PER_SAMPLE
+            raise ValueError(f"{base} waveform has {len(waveform)} samples; the buffer holds at most {max_samples}.")
+        # Disable -> retarget -> resize -> enable in one packet; the device needs ENABLE toggled
+        # around BUFFER_SIZE changes.
+        self._write_registers(
+            [f"{base}_ENABLE", f"{base}_TARGET", f"{base}_BUFFER_SIZE", f"{base}_ENABLE"],
+            [0, target_addr, buffer_size, 1],
+        )
+
+        buffer_addr, buffer_type = self._register(
+            f"{base}_BUFFER_F32" if value_type == "f32" else f"{base}_BUFFER_U16"
+        )
+        values = np.asarray(waveform, dtype=np.float64 if value_type == "f32" else np.uint16).tolist()
+        # Upload the whole table in one array write (one Modbus packet) rather than per sample.
+        for attempt in range(3):
+            try:
+                ljm.eWriteAddressArray(self.handle, buffer_addr, buffer_type, len(values), values)
+                break
+            except ljm.LJMError:
+                if attempt == 2:
+                    raise
+                time.sleep(0.01 * (attempt + 1))  # device busy; back off before retrying the batch
 
+        # LOOP_SIZE and SET_LOOP share the packet that follows the upload.
+        loop_names = [f"{base}_LOOP_SIZE"]
+        loop_values = [len(waveform)]
         if loop:
-            ljm.eWriteName(self.handle, f"{base}_SET_LOOP", 1)
+            loop_names.append(f"{base}_SET_LOOP")
+            loop_values.append(1)
+        self._write_registers(loop_names, loop_values)
 
     # ------------------------------------------------------------------ streaming
     def start_stream(self):
         """Begin a hardware-timed stream for the configured scan list."""
         enabled_streams = [f"STREAM_OUT{STREAM_OUT_INDEX}"]
-        if self._ttl_waveform:
+        if self._ttl_waveform is not None:
             enabled_streams.append(f"STREAM_OUT{TTL_STREAM_OUT_INDEX}")
 
         scan_list_names = self.stream_config.build_scan_list(enabled_streams)
         self._scan_list_addresses = ljm.namesToAddresses(len(scan_list_names), scan_list_names)[0]
         self._num_inputs = len(self.stream_config.input_names)
+        # The chunk layout is fixed for the whole stream, so allocate its buffer once here
+        # instead of building a new array from every eStreamRead list.
+        self._chunk_buffer = np.empty((self.stream_config.scans_per_read, self._num_inputs), dtype=np.float64)
 
         self.configure_led_stream_out()
-        if self._ttl_waveform:
+        if self._ttl_waveform is not None:
             self.configure_ttl_stream_out()
 
         self._actual_scan_rate = ljm.eStreamStart(
@@ -247,45 +327,70 @@ class StreamedLabJackController:
         """
         data, device_backlog, ljm_backlog = ljm.eStreamRead(self.handle)
         # Matches LabJack's stream_basic_with_stream_out example: only input channels appear in data.
-        return data, self._actual_scan_rate
+        # The returned list is sized for every scan-list address (stream-outs included), so drop
+        # the zero-filled tail that the stream-out slots leave behind.
+        return data[: self.stream_config.scans_per_read * self._num_inputs], self._actual_scan_rate
+
+    def read_stream_scans(self) -> np.ndarray:
+        """
+        Blocking call that returns one chunk as a (scans, inputs) array.
+
+        The array is a view of a buffer owned by the controller and is overwritten by
+        the next call; copy it if it needs to outlive that. The values are still copied
+        out of LJM's Python list, but into a buffer allocated once per stream.
+        """
+        data, _ = self.read_stream_chunk()  # already trimmed to whole scans of input data
+        self._chunk_buffer.reshape(-1)[: len(data)] = data
+        return self._chunk_buffer[: len(data) // self._num_inputs]
 
     def stop_stream(self):
         """Stop streaming and disable the stream-out DAC."""
         self.disable_ttl_stream()
         ljm.eStreamStop(self.handle)
         base = f"STREAM_OUT{STREAM_OUT_INDEX}"
-        ljm.eWriteName(self.handle, f"{base}_ENABLE", 0)
-        ljm.eWriteName(self.handle, LED_DAC_CHANNEL, LED_IDLE_V)
+        self._write_registers([f"{base}_ENABLE", LED_DAC_CHANNEL], [0, LED_IDLE_V])
 
     # ------------------------------------------------------------------ digital start pulse
     def fire_camera_start_pulse(self, width_s: float = START_PULSE_WIDTH_S):
         """Send a synchronous TTL pulse to the camera trigger line."""
+        high_word = (FIO0_MASK_ALLOW << 8) | 0x01
+        low_word = FIO0_MASK_ALLOW << 8
+        width_us = max(1000, int(round(width_s * 1e6)))
+        if width_us <= MAX_BLOCKING_WAIT_US:
+            try:
+                # One packet: the device itself holds FIO0 high for width_us, so host jitter can't stretch the pulse.
+                self._write_registers(
+                    [START_PULSE_TARGET, "WAIT_US_BLOCKING", START_PULSE_TARGET],
+                    [high_word, width_us, low_word],
+                )
+                return
+            except ljm.LJMError as exc:
+                if getattr(exc, "errorCode", None) != errorcodes.MBE2_ILLEGAL_DATA_ADDRESS:
+                    raise
+        # Pulse too long for WAIT_US_BLOCKING, or the device/firmware lacks one of these
+        # registers: fall back to a host-timed pulse, where jitter is small relative to the width.
         self._set_fio0_state(True)
-        time.sleep(max(0.001, width_s))
+        time.sleep(width_us / 1e6)
         self._set_fio0_state(False)
 
     def disable_ttl_stream(self):
         """Disable the TTL stream-out channel and ensure the line returns low."""
         base = f"STREAM_OUT{TTL_STREAM_OUT_INDEX}"
         try:
-            ljm.eWriteName(self.handle, f"{base}_ENABLE", 0)
+            self._write_register(f"{base}_ENABLE", 0)
         except ljm.LJMError:
             pass
         self._set_fio0_state(False)
         self._ttl_waveform = None
         self._ttl_duration_s = 0.0
 
-    def _configure_fio0_direction(self):
-        value = (FIO0_MASK_ALLOW << 8) | 0x01  # inhibit mask in upper byte, FIO0 output bit in lower byte
-        self._write_optional_register("FIO_DIRECTION", value)  # set only FIO0 as a digital output
-
     def _set_fio0_state(self, high: bool):
         value = (FIO0_MASK_ALLOW << 8) | (0x01 if high else 0x00)  # same inhibit mask, but state bit depends on high flag
         self._write_optional_register("FIO_STATE", value)  # update FIO0 level without disturbing other FIOs
 
     def _write_optional_register(self, name: str, value: float):
         try:
-            ljm.eWriteName(self.handle, name, value)  # attempt to write the given register/value pair
+            self._write_register(name, value)  # attempt to write the given register/value pair
         except ljm.LJMError as exc:
             if getattr(exc, "errorCode", None) == errorcodes.MBE2_ILLEGAL_DATA_ADDRESS:
                 return  # some devices/firmware don't expose this register; safe to ignore
@@ -306,58 +411,120 @@ def run_pulsed_stream(
     pulse_width_s: float = START_PULSE_WIDTH_S,
     post_run_padding_s: float = 0.1,
     log_path: Path | None = DATA_LOG_PATH,
+    start_event=None,  # threading/multiprocessing Event to wait on before pulsing
+    abort_event=None,  # Event that, if set when start_event fires, cancels the run before any pulses
 ):
     print(f"LabJack pulsing {num_frames} frames")
     """Helper that streams, emits a TTL pulse train, and optionally logs samples."""
     controller = StreamedLabJackController()
     controller.prepare_ttl_waveform(num_frames, trigger_rate_hz, pulse_width_s)
+    if start_event is not None:
+        start_event.wait()  # hold the pulse train until the camera reports it is armed
+    if abort_event is not None and abort_event.is_set():
+        print("LabJack run aborted before streaming; no pulses sent.")
+        controller.close()
+        return
     controller.start_stream()
 
+    # Stop after the number of scans the device clock should have produced, rather than
+    # polling the host wall clock, so the capture length follows the hardware timebase.
+    actual_scan_rate = controller._actual_scan_rate
+    target_scans = int(controller.ttl_duration_seconds * actual_scan_rate) + int(
+        post_run_padding_s * actual_scan_rate
+    )
+    input_names = list(controller.stream_config.input_names)
+
     writer = None
     csv_file = None
+    log_array = None
     if log_path is not None:
         log_path = Path(log_path)
         log_path.parent.mkdir(parents=True, exist_ok=True)
-        csv_file = log_path.open("w", newline="")
-        writer = csv.writer(csv_file)
-        writer.writerow(["sample_index", "time_s", *controller.stream_config.input_names])
+        if log_path.suffix == ".npy":
+            # Binary log: one fixed-size record per scan in a memory-mapped .npy sized up front,
+            # so each chunk is a bulk copy instead of per-row text formatting.
+            log_dtype = np.dtype(
+                [("sample_index", "<u8"), ("time_s", "<f8"), *[(name, "<f4") for name in input_names]]
+            )
+            log_array = np.lib.format.open_memmap(log_path, mode="w+", dtype=log_dtype, shape=(target_scans,))
+        else:
+            csv_file = log_path.open("w", newline="", buffering=LOG_FILE_BUFFER_BYTES)
+            writer = csv.writer(csv_file)
+            writer.writerow(["sample_index", "time_s", *input_names])
+
+    # Disk writes happen on a background thread so a slow flush never delays the next eStreamRead.
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_MAX_CHUNKS)
+    writer_thread = None
+    writer_errors: List[Exception] = []  # set by the writer thread if a disk write fails
+    if writer is not None:
+        def drain_log_queue():
+            while True:
+                batch = log_queue.get()
+                try:
+                    if batch is None:  # sentinel: acquisition finished
+                        return
+                    writer.writerows(batch)
+                except Exception as exc:  # e.g. OSError on a full disk; surfaced on the acquisition thread
+                    writer_errors.append(exc)
+                    return
+                finally:
+                    log_queue.task_done()
+
+        writer_thread = threading.Thread(target=drain_log_queue, name="labjack-csv-writer", daemon=True)
+        writer_thread.start()
 
-    num_inputs = len(controller.stream_config.input_names)
-    
-    scan_width = num_inputs  # per LJM docs, eStreamRead returns only input channels
     sample_index = 0
     sample_period = 1.0 / controller._actual_scan_rate if controller._actual_scan_rate else 0.0
+    # Per-chunk index/time offsets are the same every read; build them once and shift per chunk.
+    chunk_offsets = np.arange(controller.stream_config.scans_per_read)
+    chunk_time_offsets = chunk_offsets * sample_period
 
-    def log_chunk(data: List[float]):
+    def log_chunk(chunk: np.ndarray, max_scans: int):
         nonlocal sample_index
-        if writer is None or not data:
+        scans = min(len(chunk), max_scans)
+        if (writer is None and log_array is None) or scans <= 0:
+            sample_index += scans
+            return
+        arr = chunk[:scans]
+        idx = chunk_offsets[:scans] + sample_index
+        times = chunk_time_offsets[:scans] + sample_index * sample_period
+        if log_array is not None:
+            rows = log_array[sample_index:sample_index + scans]
+            rows["sample_index"] = idx
+            rows["time_s"] = times
+            for ch, name in enumerate(input_names):
+                rows[name] = arr[:, ch]
+            sample_index += scans
             return
-        # Trim data to the expected number of samples, for some reason extra samples at 0V appear.
-        data = data[:SCANS_PER_READ * scan_width]
-        scans = len(data) // scan_width
-        for scan in range(scans):
-            base = scan * scan_width
-            values = [data[base + ch] for ch in range(num_inputs)]
-            # print(values)
-            writer.writerow([sample_index, sample_index * sample_period, *values])
-            sample_index += 1
+        if writer_errors:
+            raise writer_errors[0]  # the writer thread died; stop acquiring rather than drop every chunk
+        batch = list(zip(idx.tolist(), times.tolist(), *arr.T.tolist()))
+        sample_index += scans
+        try:
+            log_queue.put_nowait(batch)
+        except queue.Full:
+            print(f"Warning: log queue full, dropped {scans} scans starting at sample {idx[0]}.")
 
     try:
-        ttl_end_time = time.time() + controller.ttl_duration_seconds
-        while time.time() < ttl_end_time:
-            data, _ = controller.read_stream_chunk()
-            log_chunk(data)
-
-        end_time = time.time() + post_run_padding_s
-        while time.time() < end_time:
-            data, _ = controller.read_stream_chunk()
-            log_chunk(data)
+        while sample_index < target_scans:
+            log_chunk(controller.read_stream_scans(), target_scans - sample_index)
     finally:
+        if writer_thread is not None and writer_thread.is_alive():
+            try:
+                # Let the writer drain everything queued so far, then exit.
+                log_queue.put(None, timeout=LOG_QUEUE_CLOSE_TIMEOUT_S)
+                writer_thread.join()
+            except queue.Full:
+                print("Warning: CSV writer thread did not drain its queue; closing the log anyway.")
         if csv_file:
             csv_file.close()
+        if log_array is not None:
+            log_array.flush()
         controller.stop_stream()
         controller.disable_ttl_stream()
         controller.close()
+    if writer_errors:
+        raise writer_errors[0]  # a write failed after the last chunk was queued
 
 
 if __name__ == "__main__":
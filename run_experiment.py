@@ -5,8 +5,7 @@ so both run in sync with a shared frame count and trigger cadence.
 
 from __future__ import annotations
 
-import threading
-import time
+import multiprocessing
 from pathlib import Path
 
 from labjack_stream_control import run_pulsed_stream, START_PULSE_WIDTH_S, DATA_LOG_PATH
@@ -21,37 +20,50 @@ NUM_FRAMES = int(TIME_IN_SECONDS * TRIGGER_RATE_HZ)
 EXPOSURE_TIME_US = 10000.0
 BINNING_FACTOR = 2
 CAMERA_VIDEO_PATH = Path("captures/session01.avi")      #VIDEO_PATH
-LABJACK_LOG_PATH = Path("captures/labjack_stream.csv")  #DATA_LOG_PATH
+LABJACK_LOG_PATH = Path("captures/labjack_stream.npy")  #DATA_LOG_PATH (.npy = binary memmap, .csv = text)
 
 
 def main():
-    """Start the camera capture thread, then fire the LabJack pulse train."""
+    """Run the LabJack pulse train in its own process, then capture camera frames here."""
     timeout_ms = max(1000, int((1.0 / TRIGGER_RATE_HZ) * 2000))
-    cam_thread = threading.Thread(
-        target=acquire_triggered_frames,
+    # Separate processes keep CSV logging and frame handling from contending for one GIL.
+    camera_ready = multiprocessing.Event()
+    camera_failed = multiprocessing.Event()
+    labjack_proc = multiprocessing.Process(
+        target=run_pulsed_stream,
         kwargs={
             "num_frames": NUM_FRAMES,
-            "video_path": CAMERA_VIDEO_PATH,
-            "timeout_ms": timeout_ms,
-            "exposure_us": EXPOSURE_TIME_US,
-            "video_frame_rate": TRIGGER_RATE_HZ,
-            "binning_factor": BINNING_FACTOR,
+            "trigger_rate_hz": TRIGGER_RATE_HZ,
+            "pulse_width_s": START_PULSE_WIDTH_S,
+            "log_path": LABJACK_LOG_PATH,
+            "start_event": camera_ready,  # pulses begin once the camera enters acquisition mode
+            "abort_event": camera_failed,  # ...unless the camera never got that far
         },
         daemon=False,
     )
 
-    cam_thread.start()
-    # Give the camera time to enter acquisition mode before pulses begin.
-    time.sleep(1.0)
+    labjack_proc.start()
+    try:
+        acquire_triggered_frames(
+            num_frames=NUM_FRAMES,
+            video_path=CAMERA_VIDEO_PATH,
+            timeout_ms=timeout_ms,
+            exposure_us=EXPOSURE_TIME_US,
+            video_frame_rate=TRIGGER_RATE_HZ,
+            binning_factor=BINNING_FACTOR,
+            ready_event=camera_ready,
+        )
+    finally:
+        if not camera_ready.is_set():
+            # The camera never armed: wake the LabJack process only to tell it to shut down.
+            camera_failed.set()
+            camera_ready.set()
 
-    run_pulsed_stream(
-        num_frames=NUM_FRAMES,
-        trigger_rate_hz=TRIGGER_RATE_HZ,
-        pulse_width_s=START_PULSE_WIDTH_S,
-        log_path=LABJACK_LOG_PATH,
-    )
-
-    cam_thread.join()
+    labjack_proc.join()
+    if camera_failed.is_set():
+        raise RuntimeError("Camera never entered acquisition; LabJack pulse train was not started.")
+    if labjack_proc.exitcode != 0:
+        raise RuntimeError(f"LabJack stream process failed (exit code {labjack_proc.exitcode}).")
     print("Experiment complete: camera frames saved and LabJack stream stopped.")
 
 
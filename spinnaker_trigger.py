@@ -24,6 +24,23 @@ PIXEL_FORMAT = PySpin.PixelFormat_Mono8  # requested pixel format
 VIDEO_FRAME_RATE = 30.0  # frame rate metadata for SpinVideo
 VIDEO_QUALITY = 100  # SpinVideo quality (1-100)
 BINNING_FACTOR = 1  # 1 = full resolution, 2 = 2x2 binning, etc.
+NODE_VALUE_REL_TOL = 1e-3  # relative match tolerance for nodes without a fixed increment
+PROGRESS_EVERY_N_FRAMES = 30  # print capture progress only every N frames
+CV_FOURCC_PREFERENCE = ("FFV1", "MJPG")  # OpenCV codecs to try: lossless intra first, MJPG fallback
+
+
+def set_node_if_changed(node, value: float) -> None:
+    """Write a numeric node only if it differs from value; each SetValue locks the node map."""
+    # The camera rounds writes to its own step, so compare within one increment (or a relative
+    # tolerance when the node has none) rather than requiring an exact float match.
+    tolerance = NODE_VALUE_REL_TOL * max(abs(value), 1.0)
+    if not hasattr(node, "HasInc") or node.HasInc():  # integer nodes always have an increment
+        try:
+            tolerance = max(tolerance, node.GetInc())
+        except (AttributeError, PySpin.SpinnakerException):
+            pass
+    if abs(node.GetValue() - value) >= tolerance:  # skip redundant writes
+        node.SetValue(value)
 
 
 def configure_hardware_trigger(cam: PySpin.CameraPtr) -> None:
@@ -52,7 +69,7 @@ def configure_exposure(cam: PySpin.CameraPtr, exposure_us: float, max_exposure_u
     if max_exposure_us is not None:  # cap by requested max
         target = min(target, max_exposure_us)
     clamped = min(max(node.GetMin(), target), node.GetMax())  # clamp to device limits
-    node.SetValue(clamped)  # apply exposure
+    set_node_if_changed(node, clamped)  # apply exposure
 
 
 def configure_binning(cam: PySpin.CameraPtr, binning_factor: int) -> None:
@@ -76,7 +93,7 @@ def configure_binning(cam: PySpin.CameraPtr, binning_factor: int) -> None:
         node = cam.BinningHorizontal
         target = binning_factor
         clamped = min(max(node.GetMin(), target), node.GetMax())
-        node.SetValue(clamped)
+        set_node_if_changed(node, clamped)
     else:
         print(f"Warning: BinningHorizontal not writable or unavailable.")
 
@@ -85,11 +102,31 @@ def configure_binning(cam: PySpin.CameraPtr, binning_factor: int) -> None:
         node = cam.BinningVertical
         target = binning_factor
         clamped = min(max(node.GetMin(), target), node.GetMax())
-        node.SetValue(clamped)
+        set_node_if_changed(node, clamped)
     else:
         print(f"Warning: BinningVertical not writable or unavailable.")
 
 
+def open_cv_writer(video_path: pathlib.Path, frame_rate: float, width: int, height: int, is_color: bool):
+    """Open an OpenCV writer with the first codec from CV_FOURCC_PREFERENCE this build supports."""
+    for codec in CV_FOURCC_PREFERENCE:
+        fourcc = cv2.VideoWriter_fourcc(*codec)
+        writer = cv2.VideoWriter(str(video_path), fourcc, frame_rate, (width, height), isColor=is_color)
+        if writer.isOpened():  # codec available in this OpenCV/FFmpeg build
+            return writer
+        writer.release()
+    raise RuntimeError(f"No OpenCV codec from {CV_FOURCC_PREFERENCE} could open {video_path}.")
+
+
+def configure_pixel_format(cam: PySpin.CameraPtr, pixel_format: PySpin.PixelFormatEnums) -> None:
+    """Have the camera deliver pixel_format natively so frames don't need a per-frame Convert."""
+    if hasattr(cam, "PixelFormat") and cam.PixelFormat.GetAccessMode() == PySpin.RW:
+        if cam.PixelFormat.GetValue() != pixel_format:  # only write when it actually changes
+            cam.PixelFormat.SetValue(pixel_format)
+    else:
+        print("Warning: PixelFormat not writable; frames will be converted on the host.")
+
+
 def acquire_triggered_frames(
     num_frames: int = NUM_FRAMES,
     video_path: pathlib.Path = VIDEO_PATH,
@@ -100,6 +137,7 @@ def acquire_triggered_frames(
     video_quality: int = VIDEO_QUALITY,
     binning_factor: int = BINNING_FACTOR,
     use_trigger: bool = True,
+    ready_event=None,  # threading/multiprocessing Event set once the camera is armed
 ):
     print(f"Spinnaker capturing {num_frames} frames")
     video_path = pathlib.Path(video_path)
@@ -124,6 +162,7 @@ def acquire_triggered_frames(
             configure_freerun(cam)
 
         configure_binning(cam, binning_factor)
+        configure_pixel_format(cam, pixel_format)
 
         frame_period_us = 1e6 / video_frame_rate if video_frame_rate > 0 else None
         max_exp = frame_period_us if frame_period_us is not None else None
@@ -143,6 +182,8 @@ def acquire_triggered_frames(
             tiff_dir.mkdir(parents=True, exist_ok=True)
 
         cam.BeginAcquisition()
+        if ready_event is not None:  # tell the trigger source the camera is armed
+            ready_event.set()
         frames_saved = 0
         try:
             while frames_saved < num_frames:
@@ -151,23 +192,24 @@ def acquire_triggered_frames(
                     if image.IsIncomplete():
                         print(f"Frame {frames_saved} incomplete: {image.GetImageStatus()}")
                         continue
-                    if hasattr(image, "Convert"):
-                        image = image.Convert(pixel_format)
+                    frame = image  # keep the acquired image so it is the one released below
+                    if hasattr(image, "Convert") and image.GetPixelFormat() != pixel_format:
+                        frame = image.Convert(pixel_format)  # only copy when the format differs
                     if use_video_writer and video_writer:
-                        video_writer.Append(image)
+                        video_writer.Append(frame)
                     elif cv2 is not None:
-                        nd = image.GetNDArray()
+                        nd = frame.GetNDArray()  # view of the image buffer, no copy
                         if cv_writer is None:
                             h, w = nd.shape[:2]
-                            is_color = nd.ndim == 3 and nd.shape[2] == 3
-                            fourcc = cv2.VideoWriter_fourcc(*"MJPG")
-                            cv_writer = cv2.VideoWriter(str(video_path), fourcc, video_frame_rate, (w, h), is_color)
+                            is_color = nd.ndim == 3 and nd.shape[2] == 3  # Mono8 stays single-plane
+                            cv_writer = open_cv_writer(video_path, video_frame_rate, w, h, is_color)
                         cv_writer.write(nd)
                     else:
                         tiff_path = tiff_dir / f"frame_{frames_saved:04d}.tiff"
-                        image.Save(str(tiff_path))
+                        frame.Save(str(tiff_path))
                     frames_saved += 1
-                    print(f"Captured frame {frames_saved}/{num_frames}")
+                    if frames_saved % PROGRESS_EVERY_N_FRAMES == 0 or frames_saved == num_frames:
+                        print(f"Captured frame {frames_saved}/{num_frames}")
                 finally:
                     image.Release()
         finally: